@@ -2,7 +2,11 @@ from typing import Optional
 import sys
 from DatabaseClient import DatabaseClient
 from UFWClient import UFWClient
-from main import print_ban_info
+from utils import make_progress, load_whitelist
+from IPSet import IPSet, normalize_ip, parse_ip
+from Logger import logger
+from EventStore import (EventStore, EVENT_BAN, EVENT_SKIP_EXISTING, EVENT_WHITELIST, EVENT_FAILURE, EVENT_UNBAN,
+                        EVENT_ADOPT, EVENT_DELETE_RECORD)
 
 class CLIHandler:
     def __init__(self):
@@ -10,6 +14,7 @@ class CLIHandler:
         self.ufw = UFWClient(self.db_client)
 
     def handle_arguments(self, args: list) -> Optional[int]:
+        args = self._apply_output_options(args)
         if len(args) < 2:
             self.print_help()
             return 1
@@ -31,6 +36,10 @@ class CLIHandler:
             return self.handle_redo()
         elif command == 'watch':  # 添加自动监控命令
             return self.handle_watch()
+        elif command == 'reconcile':
+            return self.handle_reconcile()
+        elif command == 'stats':
+            return self.handle_stats(args)
         elif command == 'help':
             self.print_help()
         else:
@@ -38,6 +47,22 @@ class CLIHandler:
             self.print_help()
             return 1
 
+    def _apply_output_options(self, args: list) -> list:
+        """解析输出相关的全局选项，返回去除这些选项后的参数"""
+        remaining = []
+        for arg in args:
+            if arg in ('-q', '--quiet'):
+                logger.configure(level='warning', override=True)
+            elif arg in ('-v', '--verbose'):
+                logger.configure(level='debug', override=True)
+            elif arg == '--json':
+                logger.configure(fmt='json', override=True)
+            elif arg == '--details':
+                logger.configure(ban_details=True, override=True)
+            else:
+                remaining.append(arg)
+        return remaining
+
     def handle_get(self, args: list) -> int:
         """处理 get 命令"""
         if len(args) != 3:
@@ -45,7 +70,7 @@ class CLIHandler:
             print("用法：python script.py get <ip>")
             return 1
             
-        ip = args[2]
+        ip = normalize_ip(args[2]) or args[2]
 
         success, ufw_result = self.ufw.get_banned_ips()
         if not success:
@@ -80,7 +105,7 @@ class CLIHandler:
             print("用法：python script.py unban <ip>")
             return 1
             
-        ip = args[2]
+        ip = normalize_ip(args[2]) or args[2]
         if not self.db_client.check_ip_exists(ip):
             print(f"\033[31m错误：IP {ip} 不在封禁列表中\033[0m")
             return 1
@@ -110,35 +135,40 @@ class CLIHandler:
 
     def handle_clear(self) -> int:
         """处理 clear 命令，清除所有封禁"""
+        from main import load_config
+        logger.load_config(load_config())
+
         success, result = self.ufw.get_banned_ips()
         if not success:
-            print(f"\033[31m错误：无法获取封禁列表：{result}\033[0m")
+            logger.error(f"无法获取封禁列表：{result}")
             return 1
 
         if not result:
-            print("\n\033[33m⚠️  当前没有已封禁的 IP\033[0m\n")
+            logger.warning("当前没有已封禁的 IP")
             return 0
 
         total = len(result)
-        print(f"\n\033[1;36m🧹 开始清理封禁列表 (共 {total} 条记录)\033[0m")
-        print("\033[36m" + "="*50 + "\033[0m")
+        logger.info(f"🧹 开始清理封禁列表 (共 {total} 条记录)")
 
-        success_count = 0
-        for ip, _ in result:
-            print(f"\033[1m[{success_count + 1}/{total}]\033[0m 正在解封 IP: {ip}...", end=' ')
-            success, error = self.ufw.unban_ip(ip)
-            if success:
-                self.db_client.delete_ban(ip)
-                print("\033[32m✓\033[0m")
-                success_count += 1
-            else:
-                print(f"\033[31m✗ ({error})\033[0m")
+        unbanned, failed = self.ufw.unban_ips([ip for ip, _ in result], make_progress("解封", total))
+        # 所有解封完成后一次性删除数据库记录
+        self.db_client.delete_bans(unbanned)
+        events = EventStore()
+        for ip in unbanned:
+            events.record(EVENT_UNBAN, ip, source='clear')
+        for ip, error in failed:
+            logger.error(f"✗ {ip} ({error})", ip=ip)
+            events.record(EVENT_FAILURE, ip, source='clear', error=error)
+        events.close()
+        success_count = len(unbanned)
 
-        print("\033[36m" + "="*50 + "\033[0m")
-        print(f"\n\033[1m清理完成：\033[32m{success_count}\033[0m/\033[1m{total}\033[0m 条记录已处理")
+        lines = [
+            "\033[36m" + "="*50 + "\033[0m",
+            f"\n\033[1m清理完成：\033[32m{success_count}\033[0m/\033[1m{total}\033[0m 条记录已处理",
+        ]
         if success_count != total:
-            print(f"\033[31m{total - success_count} 条记录处理失败\033[0m")
-        print()
+            lines.append(f"\033[31m{total - success_count} 条记录处理失败\033[0m")
+        logger.summary('clear', lines, total=total, succeeded=success_count, failed=total - success_count)
         return 0
 
     def print_help(self):
@@ -151,7 +181,14 @@ class CLIHandler:
         print("  \033[32mclear\033[0m  清除所有封禁记录")
         print("  \033[32mredo\033[0m   重新执行数据库中的封禁")
         print("  \033[32mwatch\033[0m  启动自动监控日志文件变动")
-        print("  \033[32mhelp\033[0m   显示帮助信息\n")
+        print("  \033[32mreconcile\033[0m 双向同步数据库与 UFW 黑名单")
+        print("  \033[32mstats\033[0m  统计封禁事件，用法：stats [天数]")
+        print("  \033[32mhelp\033[0m   显示帮助信息")
+        print("\n\033[1m输出选项：\033[0m")
+        print("  \033[32m-q, --quiet\033[0m    只输出警告、错误和每批汇总")
+        print("  \033[32m-v, --verbose\033[0m  输出调试信息（包括逐个 IP 的跳过记录）")
+        print("  \033[32m--json\033[0m         以 JSON Lines 格式输出")
+        print("  \033[32m--details\033[0m      输出每个被封禁 IP 的详情框\n")
 
 
     def handle_watch(self) -> int:
@@ -161,62 +198,192 @@ class CLIHandler:
         
     def handle_redo(self) -> int:
         """处理 redo 命令，重新执行封禁"""
+        # 获取白名单
+        from main import load_config
+        config = load_config()
+        logger.load_config(config)
+        whitelist = load_whitelist(config)
+
         # 获取数据库中的所有 IP
-        db_bans = self.db_client.get_existing_bans()  # 获取完整的封禁信息
+        db_bans = self.db_client.get_all_ban_details()  # 获取完整的封禁信息
         if not db_bans:
-            print("\n\033[33m⚠️  数据库中没有封禁记录\033[0m\n")
+            logger.warning("数据库中没有封禁记录")
             return 0
     
         # 获取 UFW 黑名单
         success, ufw_result = self.ufw.get_banned_ips()
         if not success:
-            print(f"\033[31m错误：无法获取 UFW 黑名单：{ufw_result}\033[0m")
+            logger.error(f"无法获取 UFW 黑名单：{ufw_result}")
             return 1
     
         # 获取 UFW 中的 IP 列表
-        ufw_ips = {ip[0] for ip in ufw_result}
+        ufw_ips = {ip for ip, _ in ufw_result if parse_ip(ip) is not None}
         
-        # 获取白名单
-        from main import load_config
-        config = load_config()
-        whitelist = config.get('whitelist', [])
-        
-        # 找出需要重新封禁的记录并获取详细信息
+        # 找出需要重新封禁的记录
+        events = EventStore()
         bans_to_redo = []
-        for ip, _ in db_bans:
+        whitelist_count = 0
+        for ip, path, pattern in db_bans:
             # 检查IP是否在白名单中
             if ip in whitelist:
-                print(f"\033[33m[!] 跳过白名单中的IP: {ip}\033[0m")
+                logger.debug(f"跳过白名单中的IP: {ip}", ip=ip)
+                whitelist_count += 1
+                events.record(EVENT_WHITELIST, ip, path, pattern, 'redo')
                 continue
                 
             if ip not in ufw_ips:
-                details = self.db_client.get_ip_details(ip)
-                if details:
-                    bans_to_redo.append(details)
+                bans_to_redo.append((ip, path, pattern))
+                ufw_ips.add(ip)
         
         if not bans_to_redo:
-            print("\n\033[32m✓ 所有数据库中的 IP 都已在 UFW 黑名单中\033[0m\n")
+            logger.success("所有数据库中的 IP 都已在 UFW 黑名单中")
+            events.close()
             return 0
     
         total = len(bans_to_redo)
-        print(f"\n\033[1;36m🔄 开始重新封禁 (共 {total} 个 IP)\033[0m")
-        print("\033[36m" + "="*50 + "\033[0m")
+        logger.info(f"🔄 开始重新封禁 (共 {total} 个 IP)")
     
+        progress = make_progress("重新封禁", total)
         success_count = 0
-        for ip, path, pattern in bans_to_redo:
-            print(f"\033[1m[{success_count + 1}/{total}]\033[0m 正在处理:")
-            print_ban_info(ip, path, pattern)
+        for index, (ip, path, pattern) in enumerate(bans_to_redo, 1):
+            logger.ban_detail(ip, path, pattern)
             success, error = self.ufw.ban_ip(ip)
             if success:
-                print("\033[32m✓ 封禁成功\033[0m")
                 success_count += 1
+                events.record(EVENT_BAN, ip, path, pattern, 'redo')
             else:
-                print(f"\033[31m✗ 封禁失败 ({error})\033[0m")
-            print()
+                logger.error(f"✗ {ip} 封禁失败 ({error})", ip=ip)
+                events.record(EVENT_FAILURE, ip, path, pattern, 'redo', error)
+            progress(index)
     
-        print("\033[36m" + "="*50 + "\033[0m")
-        print(f"\n\033[1m处理完成：\033[32m{success_count}\033[0m/\033[1m{total}\033[0m 个 IP 已重新封禁")
+        lines = [
+            "\033[36m" + "="*50 + "\033[0m",
+            f"\n\033[1m处理完成：\033[32m{success_count}\033[0m/\033[1m{total}\033[0m 个 IP 已重新封禁",
+        ]
+        if whitelist_count:
+            lines.append(f"\033[33m{whitelist_count} 个白名单 IP 已跳过\033[0m")
         if success_count != total:
-            print(f"\033[31m{total - success_count} 个 IP 处理失败\033[0m")
-        print()
-        return 0
\ No newline at end of file
+            lines.append(f"\033[31m{total - success_count} 个 IP 处理失败\033[0m")
+        logger.summary('redo', lines, total=total, banned=success_count,
+                       whitelisted=whitelist_count, failed=total - success_count)
+        events.close()
+        return 0
+
+    def handle_reconcile(self) -> int:
+        """处理 reconcile 命令，一次性比对数据库与 UFW 并批量修复差异"""
+        success, ufw_result = self.ufw.get_banned_ips()
+        if not success:
+            logger.error(f"无法获取 UFW 黑名单：{ufw_result}")
+            return 1
+
+        from main import load_config
+        config = load_config() or {}
+        logger.load_config(config)
+        whitelist = IPSet(load_whitelist(config))
+
+        # 两侧各加载一次为紧凑的 IPSet，之后只做集合运算
+        db_ips = self.db_client.get_banned_ip_set()
+        # 只对账单个 IP；网段规则不是本工具写入的，保持原样
+        ufw_ips = IPSet(ip for ip, _ in ufw_result if parse_ip(ip) is not None)
+
+        missing_bans = list(db_ips - ufw_ips - whitelist)    # 数据库有、UFW 没有
+        untracked = list(ufw_ips - db_ips - whitelist)       # UFW 有、数据库没有
+        orphan_records = list(db_ips & whitelist)            # 白名单 IP 的残留记录
+        stale_rules = list(ufw_ips & whitelist)              # 白名单 IP 的残留规则
+
+        logger.summary('reconcile_plan', [
+            "\n\033[1;36m🔁 对账结果\033[0m",
+            "\033[36m" + "="*50 + "\033[0m",
+            f"\033[1m待补封禁：\033[0m {len(missing_bans)}",
+            f"\033[1m待补记录：\033[0m {len(untracked)}",
+            f"\033[1m残留记录：\033[0m {len(orphan_records)}",
+            f"\033[1m残留规则：\033[0m {len(stale_rules)}",
+            "\033[36m" + "="*50 + "\033[0m",
+        ], missing_bans=len(missing_bans), untracked=len(untracked),
+            orphan_records=len(orphan_records), stale_rules=len(stale_rules))
+
+        if not (missing_bans or untracked or orphan_records or stale_rules):
+            logger.success("数据库与 UFW 黑名单一致")
+            return 0
+
+        events = EventStore()
+        failed = []
+        if missing_bans:
+            details = {ip: (path, pattern) for ip, path, pattern in self.db_client.get_all_ban_details()}
+            banned, ban_failed = self.ufw.ban_ips(missing_bans, make_progress("补封禁", len(missing_bans)))
+            for ip in banned:
+                events.record(EVENT_BAN, ip, *details.get(ip, (None, None)), 'reconcile')
+            for ip, error in ban_failed:
+                events.record(EVENT_FAILURE, ip, *details.get(ip, (None, None)), 'reconcile', error)
+            failed.extend(ban_failed)
+        if stale_rules:
+            unbanned, unban_failed = self.ufw.unban_ips(stale_rules, make_progress("移除残留规则", len(stale_rules)))
+            for ip in unbanned:
+                events.record(EVENT_UNBAN, ip, source='reconcile')
+            for ip, error in unban_failed:
+                events.record(EVENT_FAILURE, ip, source='reconcile', error=error)
+            failed.extend(unban_failed)
+
+        # 数据库侧的修改各自在一个事务内完成
+        if untracked:
+            self.db_client.save_bans([(ip, '', 'ufw') for ip in untracked])
+            for ip in untracked:
+                events.record(EVENT_ADOPT, ip, source='reconcile')
+        if orphan_records:
+            self.db_client.delete_bans(orphan_records)
+            for ip in orphan_records:
+                events.record(EVENT_DELETE_RECORD, ip, source='reconcile')
+        events.close()
+
+        for ip, error in failed:
+            logger.error(f"✗ {ip} ({error})", ip=ip)
+        total = len(missing_bans) + len(untracked) + len(orphan_records) + len(stale_rules)
+        lines = [f"\n\033[1m对账完成：\033[32m{total - len(failed)}\033[0m/\033[1m{total}\033[0m 处差异已修复"]
+        if failed:
+            lines.append(f"\033[31m{len(failed)} 处差异修复失败\033[0m")
+        logger.summary('reconcile', lines, total=total, succeeded=total - len(failed), failed=len(failed))
+        return 0 if not failed else 1
+
+    def handle_stats(self, args: list) -> int:
+        """处理 stats 命令，统计指定天数内的封禁事件"""
+        days = 7
+        if len(args) >= 3:
+            try:
+                days = int(args[2])
+            except ValueError:
+                print("\033[31m错误：天数必须为整数\033[0m")
+                print("用法：python script.py stats [天数]")
+                return 1
+
+        import time
+        since = int(time.time()) - days * 86400
+        events = EventStore()
+        counts = events.get_action_counts(since)
+        top_patterns = events.get_top_patterns(since)
+        top_prefixes = events.get_top_prefixes(since)
+        bans_by_day = events.get_bans_over_time(since, utc_offset=time.localtime().tm_gmtoff)
+        events.close()
+
+        print(f"\n\033[1;36m📊 最近 {days} 天封禁统计\033[0m")
+        print("\033[36m" + "="*50 + "\033[0m")
+        print(f"\033[1m封禁：\033[32m{counts.get(EVENT_BAN, 0)}\033[0m  "
+              f"\033[1m已存在跳过：\033[33m{counts.get(EVENT_SKIP_EXISTING, 0)}\033[0m  "
+              f"\033[1m白名单跳过：\033[33m{counts.get(EVENT_WHITELIST, 0)}\033[0m  "
+              f"\033[1m失败：\033[31m{counts.get(EVENT_FAILURE, 0)}\033[0m  "
+              f"\033[1m解封：\033[36m{counts.get(EVENT_UNBAN, 0)}\033[0m")
+        print(f"\033[1m对账收录：\033[36m{counts.get(EVENT_ADOPT, 0)}\033[0m  "
+              f"\033[1m对账删除记录：\033[36m{counts.get(EVENT_DELETE_RECORD, 0)}\033[0m")
+
+        print("\n\033[1m{:<38} {:>10}\033[0m".format("匹配规则", "次数"))
+        for pattern, hits in top_patterns:
+            print("{:<40} {:>10}".format(pattern or "未知", hits))
+
+        print("\n\033[1m{:<38} {:>10}\033[0m".format("网段", "次数"))
+        for prefix, hits in top_prefixes:
+            print("{:<40} {:>10}".format(prefix or "未知", hits))
+
+        print("\n\033[1m{:<38} {:>10}\033[0m".format("日期", "封禁数"))
+        for bucket, hits in bans_by_day:
+            print("{:<40} {:>10}".format(time.strftime('%Y-%m-%d', time.localtime(bucket)), hits))
+        print("\033[36m" + "="*50 + "\033[0m\n")
+        return 0
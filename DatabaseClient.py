@@ -2,6 +2,7 @@ import sqlite3
 import os
 import sys
 from utils import get_application_path
+from IPSet import IPSet, pack_ip, normalize_ip
 
 class DatabaseClient:
     def __init__(self, db_path='ban_address.db'):
@@ -13,9 +14,29 @@ class DatabaseClient:
         """Initialize the database if it doesn't exist"""
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
-        cursor.execute("CREATE TABLE IF NOT EXISTS ban_address (ip_addr TEXT, access_path TEXT, patterns TEXT)")
+        cursor.execute("CREATE TABLE IF NOT EXISTS ban_address (ip_addr TEXT, access_path TEXT, patterns TEXT, ip_bin BLOB)")
+        # 旧版本数据库没有 ip_bin 列，补充后回填已有记录
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(ban_address)")}
+        if 'ip_bin' not in columns:
+            cursor.execute("ALTER TABLE ban_address ADD COLUMN ip_bin BLOB")
+            rows = cursor.execute("SELECT rowid, ip_addr FROM ban_address").fetchall()
+            cursor.executemany("UPDATE ban_address SET ip_addr = ?, ip_bin = ? WHERE rowid = ?",
+                               [(normalize_ip(ip) or ip, pack_ip(ip), rowid) for rowid, ip in rows])
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_ban_address_ip_bin ON ban_address (ip_bin)")
         conn.commit()
         conn.close()
+
+    @staticmethod
+    def _ip_condition(ip):
+        """按打包后的 IP 匹配记录，使 IPv6 的不同写法指向同一条记录"""
+        packed = pack_ip(ip)
+        if packed is None:
+            return 'ip_addr = ?', ip
+        return 'ip_bin = ?', packed
+
+    @staticmethod
+    def _ban_row(ip, path, pattern):
+        return (normalize_ip(ip) or ip, path, pattern, pack_ip(ip))
     
     def get_existing_bans(self):
         """Get all existing bans from the database"""
@@ -33,8 +54,18 @@ class DatabaseClient:
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
-        cursor.execute("INSERT INTO ban_address (ip_addr, access_path, patterns) VALUES (?, ?, ?)", 
-                       (ip, path, pattern))
+        cursor.execute("INSERT INTO ban_address (ip_addr, access_path, patterns, ip_bin) VALUES (?, ?, ?, ?)", 
+                       self._ban_row(ip, path, pattern))
+        conn.commit()
+        conn.close()
+        return True
+
+    def save_bans(self, rows):
+        """在单个事务中批量保存封禁记录，rows 为 (ip, path, pattern) 列表"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.executemany("INSERT INTO ban_address (ip_addr, access_path, patterns, ip_bin) VALUES (?, ?, ?, ?)",
+                           [self._ban_row(*row) for row in rows])
         conn.commit()
         conn.close()
         return True
@@ -43,7 +74,8 @@ class DatabaseClient:
         """检查指定 IP 是否在封禁列表中"""
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
-        cursor.execute('SELECT COUNT(*) FROM ban_address WHERE ip_addr = ?', (ip,))
+        condition, value = self._ip_condition(ip)
+        cursor.execute(f'SELECT COUNT(*) FROM ban_address WHERE {condition}', (value,))
         count = cursor.fetchone()[0]
         conn.close()
         return count > 0
@@ -52,7 +84,22 @@ class DatabaseClient:
         """从数据库中删除指定 IP 的封禁记录"""
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
-        cursor.execute('DELETE FROM ban_address WHERE ip_addr = ?', (ip,))
+        condition, value = self._ip_condition(ip)
+        cursor.execute(f'DELETE FROM ban_address WHERE {condition}', (value,))
+        conn.commit()
+        conn.close()
+
+    def delete_bans(self, ips):
+        """在单个事务中批量删除指定 IP 的封禁记录"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        # 无法解析的旧记录按 ip_addr 匹配，与单条删除保持一致
+        by_condition = {}
+        for ip in ips:
+            condition, value = self._ip_condition(ip)
+            by_condition.setdefault(condition, []).append((value,))
+        for condition, rows in by_condition.items():
+            cursor.executemany(f'DELETE FROM ban_address WHERE {condition}', rows)
         conn.commit()
         conn.close()
     
@@ -60,7 +107,8 @@ class DatabaseClient:
         """获取指定 IP 的匹配规则"""
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
-        cursor.execute('SELECT patterns FROM ban_address WHERE ip_addr = ?', (ip,))
+        condition, value = self._ip_condition(ip)
+        cursor.execute(f'SELECT patterns FROM ban_address WHERE {condition}', (value,))
         result = cursor.fetchone()
         conn.close()
         return result[0] if result else None
@@ -69,11 +117,21 @@ class DatabaseClient:
         """获取指定 IP 的详细信息"""
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
-        cursor.execute('SELECT ip_addr, access_path, patterns FROM ban_address WHERE ip_addr = ?', (ip,))
+        condition, value = self._ip_condition(ip)
+        cursor.execute(f'SELECT ip_addr, access_path, patterns FROM ban_address WHERE {condition}', (value,))
         result = cursor.fetchone()
         conn.close()
         return result
     
+    def get_all_ban_details(self) -> list:
+        """一次性获取所有封禁记录的详细信息"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('SELECT ip_addr, access_path, patterns FROM ban_address')
+        result = cursor.fetchall()
+        conn.close()
+        return result
+
     def get_all_banned_ips(self) -> list:
         """获取所有被封禁的 IP 地址列表"""
         conn = sqlite3.connect(self.db_path)
@@ -82,4 +140,12 @@ class DatabaseClient:
         result = [row[0] for row in cursor.fetchall()]
         conn.close()
         return result
-    
\ No newline at end of file
+
+    def get_banned_ip_set(self) -> IPSet:
+        """直接从打包列构建 IPSet，不经过字符串解析"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('SELECT ip_bin FROM ban_address WHERE ip_bin IS NOT NULL')
+        result = IPSet.from_packed(row[0] for row in cursor)
+        conn.close()
+        return result
@@ -0,0 +1,159 @@
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+import time
+from utils import get_application_path
+from Logger import logger
+from IPSet import parse_ip, format_ip
+
+# 事件类型
+EVENT_BAN = 'ban'
+EVENT_SKIP_EXISTING = 'skip_existing'
+EVENT_WHITELIST = 'whitelist'
+EVENT_FAILURE = 'failure'
+EVENT_UNBAN = 'unban'
+# reconcile 的一次性修复，与封禁流程中的决策分开统计
+EVENT_ADOPT = 'adopt'
+EVENT_DELETE_RECORD = 'delete_record'
+
+
+class EventStore:
+    """封禁决策事件日志，只追加写入，由后台线程批量落盘"""
+
+    def __init__(self, db_path='ban_events.db', batch_size=500, flush_interval=1.0):
+        application_path = get_application_path()
+        self.db_path = os.path.join(application_path, db_path)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._initialize_db()
+
+        self._queue = queue.Queue()
+        self._closed = False
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def _initialize_db(self):
+        """初始化事件表及统计查询所需的索引"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("""CREATE TABLE IF NOT EXISTS ban_events (
+            ts INTEGER NOT NULL,
+            action TEXT NOT NULL,
+            ip_addr TEXT,
+            prefix TEXT,
+            access_path TEXT,
+            patterns TEXT,
+            source TEXT,
+            error TEXT)""")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_events_action_ts ON ban_events (action, ts)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_events_action_ts_pattern ON ban_events (action, ts, patterns)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_events_action_ts_prefix ON ban_events (action, ts, prefix)")
+        conn.commit()
+        conn.close()
+
+    def record(self, action, ip, path=None, pattern=None, source=None, error=None):
+        """记录一条决策事件，仅入队，不在调用线程中访问数据库"""
+        if self._closed:
+            return
+        self._queue.put((int(time.time()), action, ip, path, pattern, source, error))
+
+    def close(self):
+        """写入剩余事件并停止后台线程
+
+        等待队列全部落盘后才返回；后台线程是守护线程，提前返回会在退出时丢弃未写入的事件。
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._writer.join()
+
+    def _write_loop(self):
+        conn = sqlite3.connect(self.db_path)
+        stopping = False
+        while not stopping:
+            batch = []
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            # 尽量一次取出更多事件，合并为一个事务
+            while item is not None:
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if item is None:
+                stopping = True
+            if batch:
+                self._insert_batch(conn, batch)
+        conn.close()
+
+    def _insert_batch(self, conn, batch):
+        rows = [(ts, action, ip, _ip_prefix(ip), path, pattern, source, error)
+                for ts, action, ip, path, pattern, source, error in batch]
+        try:
+            conn.executemany("INSERT INTO ban_events (ts, action, ip_addr, prefix, access_path, patterns, source, error) "
+                             "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"写入事件日志失败: {str(e)}", dropped=len(rows))
+
+    def get_action_counts(self, since):
+        """统计指定时间以来各类决策的数量"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute("SELECT action, COUNT(*) FROM ban_events WHERE action IN (?, ?, ?, ?, ?, ?, ?) AND ts >= ? "
+                       "GROUP BY action",
+                       (EVENT_BAN, EVENT_SKIP_EXISTING, EVENT_WHITELIST, EVENT_FAILURE, EVENT_UNBAN,
+                        EVENT_ADOPT, EVENT_DELETE_RECORD, since))
+        result = dict(cursor.fetchall())
+        conn.close()
+        return result
+
+    def get_top_patterns(self, since, limit=10):
+        """获取指定时间以来触发封禁最多的匹配规则"""
+        return self._top_by('patterns', since, limit)
+
+    def get_top_prefixes(self, since, limit=10):
+        """获取指定时间以来封禁最多的网段"""
+        return self._top_by('prefix', since, limit)
+
+    def _top_by(self, column, since, limit):
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT {column}, COUNT(*) AS hits FROM ban_events WHERE action = ? AND ts >= ? "
+                       f"GROUP BY {column} ORDER BY hits DESC LIMIT ?",
+                       (EVENT_BAN, since, limit))
+        result = cursor.fetchall()
+        conn.close()
+        return result
+
+    def get_bans_over_time(self, since, bucket=86400, utc_offset=0):
+        """按时间段统计封禁数量，bucket 为秒数，默认按天；utc_offset 用于按本地时区切分"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute("SELECT ((ts + ?) / ?) * ? - ? AS bucket, COUNT(*) FROM ban_events WHERE action = ? AND ts >= ? "
+                       "GROUP BY bucket ORDER BY bucket",
+                       (utc_offset, bucket, bucket, utc_offset, EVENT_BAN, since))
+        result = cursor.fetchall()
+        conn.close()
+        return result
+
+
+def _ip_prefix(ip):
+    """IPv4 取 /24，IPv6 取 /64 作为统计用网段"""
+    parsed = parse_ip(ip)
+    if parsed is None:
+        return None
+    version, value = parsed
+    if version == 4:
+        return f"{format_ip(4, value & 0xffffff00)}/24"
+    return f"{format_ip(6, value >> 64 << 64)}/64"
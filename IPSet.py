@@ -0,0 +1,183 @@
+import socket
+from array import array
+from bisect import bisect_left, bisect_right
+
+# IPv4 统一映射到 ::ffff:0:0/96，使两种地址可以放在同一个 128 位空间里比较
+_V4_MAPPED_PREFIX = 0xffff << 32
+_U64_MASK = (1 << 64) - 1
+
+
+def parse_ip(text):
+    """解析 IP 字符串，返回 (版本, 整数)；无法解析时返回 None"""
+    if not isinstance(text, str):
+        return None
+    try:
+        if ':' in text:
+            value = int.from_bytes(socket.inet_pton(socket.AF_INET6, text), 'big')
+            # ::ffff:a.b.c.d 按 IPv4 处理
+            if value >> 32 == 0xffff:
+                return (4, value & 0xffffffff)
+            return (6, value)
+        return (4, int.from_bytes(socket.inet_pton(socket.AF_INET, text), 'big'))
+    except (OSError, ValueError):
+        return None
+
+
+def format_ip(version, value):
+    """将 (版本, 整数) 转回规范的 IP 字符串"""
+    if version == 4:
+        return socket.inet_ntop(socket.AF_INET, value.to_bytes(4, 'big'))
+    return socket.inet_ntop(socket.AF_INET6, value.to_bytes(16, 'big'))
+
+
+def normalize_ip(text):
+    """返回规范形式的 IP 字符串（IPv6 压缩小写），无法解析时返回 None"""
+    parsed = parse_ip(text)
+    return format_ip(*parsed) if parsed else None
+
+
+def pack_ip(text):
+    """将 IP 打包为 16 字节大端序，用于数据库存储和索引"""
+    parsed = parse_ip(text)
+    if parsed is None:
+        return None
+    version, value = parsed
+    if version == 4:
+        value |= _V4_MAPPED_PREFIX
+    return value.to_bytes(16, 'big')
+
+
+def unpack_ip(packed):
+    """pack_ip 的逆操作，返回 (版本, 整数)"""
+    value = int.from_bytes(packed, 'big')
+    if value >> 32 == 0xffff:
+        return (4, value & 0xffffffff)
+    return (6, value)
+
+
+class IPSet:
+    """紧凑的有序 IP 集合
+
+    IPv4 以 32 位整数保存在 array('I') 中；IPv6 拆成高、低两个 64 位整数，分别保存在
+    两个 array('Q') 中并按 (高, 低) 排序。查找全部使用 C 实现的 bisect，
+    适合长期驻留内存的大型封禁集合；逐条日志的去重等临时集合直接使用 set 即可。
+    """
+
+    def __init__(self, ips=()):
+        self._fill(self._parse_strict(ip) for ip in ips)
+
+    @classmethod
+    def from_packed(cls, packed_values):
+        """从数据库中的 16 字节打包值构建集合"""
+        result = cls()
+        result._fill(unpack_ip(packed) for packed in packed_values)
+        return result
+
+    def _fill(self, parsed):
+        v4 = set()
+        v6 = set()
+        for version, value in parsed:
+            (v4 if version == 4 else v6).add(value)
+        self._set_sorted(sorted(v4), sorted(v6))
+
+    def _set_sorted(self, v4_values, v6_values):
+        """用已排序且无重复的整数序列替换内容"""
+        self._v4 = array('I', v4_values)
+        self._v6_hi = array('Q', [value >> 64 for value in v6_values])
+        self._v6_lo = array('Q', [value & _U64_MASK for value in v6_values])
+
+    @staticmethod
+    def _parse_strict(ip):
+        parsed = parse_ip(ip)
+        if parsed is None:
+            raise ValueError(f"无效的 IP 地址: {ip!r}")
+        return parsed
+
+    def _find_v6(self, value):
+        """返回 (插入位置, 是否已存在)"""
+        hi, lo = value >> 64, value & _U64_MASK
+        start = bisect_left(self._v6_hi, hi)
+        end = bisect_right(self._v6_hi, hi, start)
+        index = bisect_left(self._v6_lo, lo, start, end)
+        return index, index < end and self._v6_lo[index] == lo
+
+    def __contains__(self, ip):
+        parsed = parse_ip(ip)
+        if parsed is None:
+            return False
+        version, value = parsed
+        if version == 4:
+            index = bisect_left(self._v4, value)
+            return index < len(self._v4) and self._v4[index] == value
+        return self._find_v6(value)[1]
+
+    def add(self, ip):
+        """插入单个地址，代价为 O(n) 的数组移动，只适合低频调用（如每次实际封禁后）"""
+        version, value = self._parse_strict(ip)
+        if version == 4:
+            index = bisect_left(self._v4, value)
+            if index == len(self._v4) or self._v4[index] != value:
+                self._v4.insert(index, value)
+            return
+        index, found = self._find_v6(value)
+        if not found:
+            self._v6_hi.insert(index, value >> 64)
+            self._v6_lo.insert(index, value & _U64_MASK)
+
+    def discard(self, ip):
+        parsed = parse_ip(ip)
+        if parsed is None:
+            return
+        version, value = parsed
+        if version == 4:
+            index = bisect_left(self._v4, value)
+            if index < len(self._v4) and self._v4[index] == value:
+                del self._v4[index]
+            return
+        index, found = self._find_v6(value)
+        if found:
+            del self._v6_hi[index]
+            del self._v6_lo[index]
+
+    def __len__(self):
+        return len(self._v4) + len(self._v6_hi)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __iter__(self):
+        """按 IPv4、IPv6 的顺序升序返回规范化的 IP 字符串"""
+        for value in self._v4:
+            yield format_ip(4, value)
+        for value in self._v6_values():
+            yield format_ip(6, value)
+
+    def __eq__(self, other):
+        if not isinstance(other, IPSet):
+            return NotImplemented
+        return self._v4 == other._v4 and self._v6_hi == other._v6_hi and self._v6_lo == other._v6_lo
+
+    def __repr__(self):
+        return f"IPSet({list(self)!r})"
+
+    def _v6_values(self):
+        return [(hi << 64) | lo for hi, lo in zip(self._v6_hi, self._v6_lo)]
+
+    def _combine(self, other, keep_common):
+        """keep_common=True 求交集，否则求差集；过滤保持原有顺序，无需重新排序"""
+        v4_other = set(other._v4)
+        v6_other = set(other._v6_values())
+        result = IPSet()
+        if keep_common:
+            result._set_sorted([value for value in self._v4 if value in v4_other],
+                               [value for value in self._v6_values() if value in v6_other])
+        else:
+            result._set_sorted([value for value in self._v4 if value not in v4_other],
+                               [value for value in self._v6_values() if value not in v6_other])
+        return result
+
+    def __sub__(self, other):
+        return self._combine(other, keep_common=False)
+
+    def __and__(self, other):
+        return self._combine(other, keep_common=True)
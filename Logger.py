@@ -0,0 +1,153 @@
+import atexit
+import json
+import sys
+import threading
+import time
+
+LEVELS = {'debug': 10, 'info': 20, 'warning': 30, 'error': 40}
+
+# 文本模式下各级别的颜色与前缀
+_TEXT_STYLES = {
+    'debug': ('\033[90m', '[-]'),
+    'info': ('\033[36m', '[*]'),
+    'success': ('\033[32m', '[+]'),
+    'warning': ('\033[33m', '[!]'),
+    'error': ('\033[31m', '[!]'),
+}
+
+
+class Logger:
+    """分级、带缓冲的输出，支持文本与 JSON Lines 两种格式"""
+
+    def __init__(self, stream=None, level='info', fmt='text', ban_details=False,
+                 buffer_size=64, flush_interval=1.0):
+        self.stream = stream or sys.stdout
+        self.level = LEVELS[level]
+        self.fmt = fmt
+        self.ban_details = ban_details
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._overrides = set()
+        atexit.register(self.flush)
+
+    def configure(self, level=None, fmt=None, ban_details=None, override=False):
+        """修改输出设置；override=True 时（命令行参数）不会被配置文件覆盖"""
+        for key, value in (('level', level), ('fmt', fmt), ('ban_details', ban_details)):
+            if value is None:
+                continue
+            if not override and key in self._overrides:
+                continue
+            if key == 'level':
+                if value not in LEVELS:
+                    raise ValueError(f"未知的日志级别: {value}")
+                value = LEVELS[value]
+            if key == 'fmt' and value not in ('text', 'json'):
+                raise ValueError(f"未知的输出格式: {value}")
+            setattr(self, key, value)
+            if override:
+                self._overrides.add(key)
+
+    def load_config(self, config):
+        """从配置文件的 output 段读取设置"""
+        output = (config or {}).get('output') or {}
+        self.configure(level=output.get('level'), fmt=output.get('format'),
+                       ban_details=output.get('ban_details'))
+
+    def is_enabled(self, level):
+        return LEVELS[level] >= self.level
+
+    def debug(self, msg, **fields):
+        self._log('debug', msg, fields)
+
+    def info(self, msg, **fields):
+        self._log('info', msg, fields)
+
+    def success(self, msg, **fields):
+        self._log('info', msg, fields, style='success')
+
+    def warning(self, msg, **fields):
+        self._log('warning', msg, fields)
+
+    def error(self, msg, **fields):
+        # 不单独刷新：批量失败时逐条同步写入会拖慢封禁循环，由缓冲策略和批次汇总负责刷新
+        self._log('error', msg, fields)
+
+    def ban_detail(self, ip, path, pattern):
+        """单个 IP 的封禁详情，仅在开启 ban_details 时输出完整信息框"""
+        if not self.ban_details:
+            self.debug(f"封禁 IP: {ip} ({pattern})", ip=ip, path=path, pattern=pattern)
+            return
+        if self.fmt == 'json':
+            self._emit({'level': 'info', 'msg': 'ban', 'ip': ip, 'path': path, 'pattern': pattern})
+            return
+        self._write("\033[32m+" + "="*50 + "+\033[0m")
+        self._write(f"\033[32m| IP地址: {ip:<42} |\033[0m")
+        self._write(f"\033[36m| 访问路径: {path:<40} |\033[0m")
+        self._write(f"\033[33m| 匹配规则: {pattern:<40} |\033[0m")
+        self._write("\033[32m+" + "="*50 + "+\033[0m")
+
+    def summary(self, event, text_lines, **counts):
+        """输出一批处理的汇总，不受日志级别限制，并立即刷新缓冲"""
+        if self.fmt == 'json':
+            self._emit({'level': 'summary', 'msg': event, **counts})
+        else:
+            for line in text_lines:
+                self._write(line)
+        self.flush()
+
+    def progress(self, label, done, total, rate, eta):
+        """进度信息；终端上原地刷新，非终端或 JSON 模式只输出最终结果"""
+        finished = done >= total
+        if self.fmt == 'json':
+            if finished:
+                self._emit({'level': 'info', 'msg': 'progress', 'label': label,
+                            'done': done, 'total': total, 'rate': round(rate, 1)})
+            return
+        if not self.is_enabled('info'):
+            return
+        line = f"\033[36m[*] {label}: {done}/{total} ({rate:.0f}/s, 剩余约 {eta:.0f}s)\033[0m"
+        if self.stream.isatty():
+            with self._lock:
+                self._flush_locked()
+                self.stream.write('\r' + line + ('\n' if finished else ''))
+                self.stream.flush()
+        elif finished:
+            self._write(line)
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _log(self, level, msg, fields, style=None):
+        if LEVELS[level] < self.level:
+            return
+        if self.fmt == 'json':
+            self._emit({'level': level, 'msg': msg, **fields})
+            return
+        color, prefix = _TEXT_STYLES[style or level]
+        self._write(f"{color}{prefix} {msg}\033[0m")
+
+    def _emit(self, record):
+        record = {'ts': round(time.time(), 3), **record}
+        self._write(json.dumps(record, ensure_ascii=False))
+
+    def _write(self, line):
+        with self._lock:
+            self._buffer.append(line)
+            if (len(self._buffer) >= self.buffer_size
+                    or time.monotonic() - self._last_flush >= self.flush_interval):
+                self._flush_locked()
+
+    def _flush_locked(self):
+        self._last_flush = time.monotonic()
+        if not self._buffer:
+            return
+        self.stream.write('\n'.join(self._buffer) + '\n')
+        self.stream.flush()
+        self._buffer = []
+
+
+logger = Logger()
@@ -1,38 +1,230 @@
+import ipaddress
+import os
+import shutil
 import subprocess
+from IPSet import normalize_ip
 
 class UFWClient:
-    def __init__(self, db_client):
+    def __init__(self, db_client, user_rules='/etc/ufw/user.rules', user6_rules='/etc/ufw/user6.rules'):
         self.db_client = db_client
+        self.user_rules = user_rules
+        self.user6_rules = user6_rules
 
     def ban_ip(self, ip):
         if not isinstance(ip, str):
             return (False, 'Invalid IP type')
         try:
-            subprocess.run(['ufw', 'deny', 'from', ip], check=True)
+            # 捕获 ufw 的逐条输出，避免批量操作时刷屏
+            subprocess.run(['ufw', 'deny', 'from', ip], capture_output=True, text=True, check=True)
             return (True, None)
         except subprocess.CalledProcessError as e:
-            return (False, f'Failed to ban IP {ip}: {e}')
+            return (False, f'Failed to ban IP {ip}: {(e.stderr or str(e)).strip()}')
 
     def unban_ip(self, ip):
         if not isinstance(ip, str):
             return (False, 'Invalid IP type')
         try:
-            subprocess.run(['ufw', 'delete', 'deny', 'from', ip], check=True)
+            # 捕获 ufw 的逐条输出，避免批量操作时刷屏
+            subprocess.run(['ufw', 'delete', 'deny', 'from', ip], capture_output=True, text=True, check=True)
             return (True, None)
         except subprocess.CalledProcessError as e:
-            return (False, f'Failed to unban IP {ip}: {e}')
+            return (False, f'Failed to unban IP {ip}: {(e.stderr or str(e)).strip()}')
 
     def get_banned_ips(self):
         try:
             result = subprocess.run(['ufw', 'status'], capture_output=True, text=True, check=True)
             banned_ips = []
             for line in result.stdout.splitlines():
-                if 'DENY' in line:
-                    parts = line.split()
-                    if len(parts) >= 3 and parts[0] == 'Anywhere':
-                        banned_ips.append((parts[2], 'Anywhere'))
-                    elif len(parts) >= 2 and parts[1] == 'DENY':
-                        banned_ips.append((parts[0], 'Anywhere'))
+                ip = self._parse_deny_rule(line)
+                if ip is not None:
+                    banned_ips.append((ip, 'Anywhere'))
             return (True, banned_ips)
         except subprocess.CalledProcessError as e:
             return (False, f'Failed to get banned IPs: {e}')
+
+    @staticmethod
+    def _parse_deny_rule(line):
+        """解析 ufw status 中的一行 DENY 规则，返回规范化的 IP 或网段
+
+        兼容 IPv6 规则中的 "(v6)" 标记，例如：
+            Anywhere                   DENY        1.2.3.4
+            Anywhere (v6)              DENY        2001:db8::1
+            Anywhere                   DENY        10.0.0.0/8
+        网段规则返回 "10.0.0.0/8" 形式的字符串，只处理单个 IP 的调用方需自行跳过；
+        Anywhere 等无法解析的来源返回 None。
+        """
+        parts = line.split('#', 1)[0].split()
+        if 'DENY' not in parts:
+            return None
+        index = parts.index('DENY')
+        to_parts = [part for part in parts[:index] if part != '(v6)']
+        from_parts = [part for part in parts[index + 1:] if part not in ('IN', 'OUT', 'FWD', '(v6)')]
+        if to_parts == ['Anywhere'] and from_parts:
+            return UFWClient._normalize_source(from_parts[0])
+        if to_parts and from_parts and from_parts[0] == 'Anywhere':
+            return UFWClient._normalize_source(to_parts[0])
+        return None
+
+    @staticmethod
+    def _normalize_source(text):
+        """单个 IP 返回规范化的地址，网段返回规范化的 CIDR，其余返回 None"""
+        if text is None:
+            return None
+        ip = normalize_ip(text)
+        if ip is not None:
+            return ip
+        try:
+            return str(ipaddress.ip_network(text, strict=False))
+        except ValueError:
+            return None
+
+    def ban_ips(self, ips, progress=None):
+        """批量封禁 IP，返回 (成功列表, [(ip, 错误信息)])"""
+        return self._apply_rules_batch(ips, True, progress)
+
+    def unban_ips(self, ips, progress=None):
+        """批量解封 IP，返回 (成功列表, [(ip, 错误信息)])"""
+        return self._apply_rules_batch(ips, False, progress)
+
+    def _apply_rules_batch(self, ips, deny, progress):
+        """直接编辑 user.rules/user6.rules 后只执行一次 ufw reload
+
+        逐条执行 ufw deny/delete 时每条规则都会重写规则文件并重新加载，
+        无法处理上万条规则；规则文件不可用时退回逐条执行。
+        """
+        ips = list(ips)
+        if not ips:
+            return ([], [])
+        by_file = {self.user_rules: [], self.user6_rules: []}
+        for ip in ips:
+            by_file[self.user6_rules if ':' in ip else self.user_rules].append(ip)
+
+        originals = {}
+        missing = []
+        try:
+            for path, targets in by_file.items():
+                if not targets:
+                    continue
+                with open(path, 'r', encoding='utf-8') as f:
+                    originals[path] = f.read()
+                v6 = path == self.user6_rules
+                if deny:
+                    content = self._add_deny_rules(originals[path], targets, v6)
+                else:
+                    content, not_found = self._remove_deny_rules(originals[path], targets)
+                    missing.extend(not_found)
+                self._write_rules_file(path, content)
+        except (OSError, ValueError):
+            # 规则文件不存在、无权限或格式无法识别：恢复已修改的文件，逐条执行
+            self._restore_rules_files(originals)
+            action = self.ban_ip if deny else self.unban_ip
+            return self._apply_batch(action, ips, progress)
+
+        try:
+            subprocess.run(['ufw', 'reload'], capture_output=True, text=True, check=True)
+        except (OSError, subprocess.CalledProcessError) as e:
+            self._restore_rules_files(originals)
+            error = getattr(e, 'stderr', None) or str(e)
+            return ([], [(ip, f'Failed to reload ufw: {error.strip()}') for ip in ips])
+
+        if not missing:
+            if progress:
+                progress(len(ips))
+            return (ips, [])
+
+        # 规则文件中找不到对应规则块（格式不同或已不存在）的 IP 交给 ufw delete 逐条处理
+        missing_set = set(missing)
+        succeeded = [ip for ip in ips if ip not in missing_set]
+        retried, failed = self._apply_batch(self.unban_ip, missing, None)
+        if progress:
+            progress(len(ips))
+        return (succeeded + retried, failed)
+
+    @staticmethod
+    def _deny_block(ip, v6):
+        """与 ufw deny from <ip> 写入规则文件的格式一致"""
+        dst = '::/0' if v6 else '0.0.0.0/0'
+        chain = 'ufw6-user-input' if v6 else 'ufw-user-input'
+        return [f'### tuple ### deny any any {dst} any {ip} in',
+                f'-A {chain} -s {ip} -j DROP',
+                '']
+
+    @staticmethod
+    def _tuple_source(line):
+        """返回 deny from 规则元组中的来源地址，其他规则返回 None
+
+        带注释的规则在末尾多一个 comment=<hex> 字段。
+        """
+        parts = line.split()
+        if len(parts) == 11 and parts[10].startswith('comment='):
+            parts = parts[:10]
+        if len(parts) == 10 and parts[:4] == ['###', 'tuple', '###', 'deny'] \
+                and parts[4:6] == ['any', 'any'] and parts[7] == 'any' and parts[9] == 'in':
+            return parts[8]
+        return None
+
+    def _add_deny_rules(self, content, ips, v6):
+        lines = content.split('\n')
+        if '### END RULES ###' not in lines:
+            raise ValueError('无法识别的 ufw 规则文件格式')
+        existing = {self._normalize_source(self._tuple_source(line)) for line in lines}
+        new_lines = []
+        for ip in dict.fromkeys(ips):
+            if ip not in existing:
+                new_lines.extend(self._deny_block(ip, v6))
+        index = lines.index('### END RULES ###')
+        return '\n'.join(lines[:index] + new_lines + lines[index:])
+
+    def _remove_deny_rules(self, content, ips):
+        """删除指定 IP 的规则块，返回 (新内容, 未找到规则块的 IP 列表)"""
+        targets = {self._normalize_source(ip) or ip: ip for ip in ips}
+        found = set()
+        result = []
+        skipping = False
+        for line in content.split('\n'):
+            if line.startswith('### tuple ###'):
+                source = self._normalize_source(self._tuple_source(line))
+                skipping = source in targets
+                if skipping:
+                    found.add(source)
+            elif skipping and line.startswith('-A '):
+                pass
+            elif skipping and line == '':
+                skipping = False
+                continue
+            else:
+                skipping = False
+            if not skipping:
+                result.append(line)
+        missing = [ip for key, ip in targets.items() if key not in found]
+        return '\n'.join(result), missing
+
+    @staticmethod
+    def _write_rules_file(path, content):
+        # 先写临时文件再替换，避免中途失败留下不完整的规则文件
+        tmp_path = path + '.bpauto.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        shutil.copymode(path, tmp_path)
+        os.replace(tmp_path, path)
+
+    def _restore_rules_files(self, originals):
+        for path, content in originals.items():
+            try:
+                self._write_rules_file(path, content)
+            except OSError:
+                pass
+
+    def _apply_batch(self, action, ips, progress):
+        # 逐条执行的后备方案；统一收集结果，由调用方在结束后一次性写入数据库
+        succeeded = []
+        failed = []
+        for index, ip in enumerate(ips, 1):
+            success, error = action(ip)
+            if success:
+                succeeded.append(ip)
+            else:
+                failed.append((ip, error))
+            if progress:
+                progress(index)
+        return (succeeded, failed)
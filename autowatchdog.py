@@ -10,69 +10,151 @@ from watchdog.events import FileSystemEventHandler, FileModifiedEvent
 from collections import defaultdict
 from UFWClient import UFWClient
 from DatabaseClient import DatabaseClient
-from utils import extract_ip_and_path, match_paths, print_ban_info, load_config
+from EventStore import EventStore, EVENT_BAN, EVENT_SKIP_EXISTING, EVENT_WHITELIST, EVENT_FAILURE
+from utils import extract_ip_and_path, match_paths, load_config, format_ban_summary, load_whitelist
+from IPSet import IPSet, parse_ip
+from Logger import logger
 import threading
 
 
 class LogFileHandler(FileSystemEventHandler):
     """处理日志文件变动的事件处理器"""
     
-    def __init__(self, log_file, patterns, db_client, ufw_client, config):
+    def __init__(self, log_file, patterns, db_client, ufw_client, config, events):
         self.log_file = log_file
         self.patterns = patterns
         self.db_client = db_client
         self.ufw_client = ufw_client
+        self.events = events
         self.last_position = self._get_file_size()
-        self.processed_ips = set()
+
+        # 事件合并状态：on_modified 只计数，由 ReadScheduler 按间隔统一读取
+        watch_config = config.get('watch') or {}
+        self.min_interval = float(watch_config.get('min_interval', 0.2))
+        self.max_interval = float(watch_config.get('max_interval', 5.0))
+        self.busy_rate = float(watch_config.get('busy_rate', 50.0))
+        self.interval = self.min_interval
+        self.polling = False
+        self._lock = threading.Lock()
+        self._pending_events = 0
+        self._first_event_at = None
+        self._last_check_at = time.monotonic()
+        self._partial_line = b''
+
+        # 统计信息
+        self.total_events = 0
+        self.total_reads = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
         
         # 获取现有封禁列表
-        self.existing_bans = {ip for ip, _ in db_client.get_existing_bans()}
+        self.existing_bans = db_client.get_banned_ip_set()
         success, ufw_result = ufw_client.get_banned_ips()
         if success:
-            self.ufw_bans = {ip for ip, _ in ufw_result}
+            # 网段规则无法放入 IPSet，只保留单个 IP
+            self.ufw_bans = IPSet(ip for ip, _ in ufw_result if parse_ip(ip) is not None)
         else:
-            print(f"\033[31m[!] 无法获取UFW封禁列表: {ufw_result}\033[0m")
-            self.ufw_bans = set()
+            logger.error(f"无法获取UFW封禁列表: {ufw_result}")
+            self.ufw_bans = IPSet()
         
         # 添加白名单支持
-        self.whitelist = set(config.get('whitelist', []))
+        self.whitelist = load_whitelist(config)
     
     def _get_file_size(self):
         """获取文件大小"""
-        if os.path.exists(self.log_file):
-            return os.path.getsize(self.log_file)
-        return 0
+        try:
+            return os.stat(self.log_file).st_size
+        except FileNotFoundError:
+            return 0
     
     def on_modified(self, event):
-        """当文件被修改时触发"""
+        """当文件被修改时触发，只记录事件，不做任何文件操作"""
         if not isinstance(event, FileModifiedEvent):
             return
             
         if event.src_path != self.log_file:
             return
-            
+
+        with self._lock:
+            if self._pending_events == 0:
+                self._first_event_at = time.monotonic()
+            self._pending_events += 1
+            self.total_events += 1
+
+    def poll(self, now):
+        """由调度线程调用：合并期间的事件，最多读取一次文件，并调整下次读取间隔"""
+        with self._lock:
+            pending = self._pending_events
+            first_event_at = self._first_event_at
+            self._pending_events = 0
+            self._first_event_at = None
+        last_check_at = self._last_check_at
+        self._last_check_at = now
+
+        # 事件模式下没有新事件，无需任何系统调用
+        if not self.polling and pending == 0:
+            self.interval = max(self.interval / 2, self.min_interval)
+            return
+
+        bytes_read, lines_read = self._read_new_content()
+        if bytes_read:
+            self.total_reads += 1
+            # 轮询模式无法得知第一次写入的时间，以上次检查时间作为上界
+            lag = now - (first_event_at if first_event_at is not None else last_check_at)
+            self.total_lag += lag
+            self.max_lag = max(self.max_lag, lag)
+
+        # 按每秒事件数（轮询模式下为每秒新增行数）判断负载：超过阈值拉长间隔，否则缩短
+        events = lines_read if self.polling else pending
+        rate = events / max(now - last_check_at, 1e-3)
+        if rate > self.busy_rate:
+            self.interval = min(self.interval * 2, self.max_interval)
+        else:
+            self.interval = max(self.interval / 2, self.min_interval)
+
+    def _read_new_content(self):
+        """读取新增内容并处理，返回 (读取的字节数, 完整的行数)"""
         # 获取文件当前大小
         current_size = self._get_file_size()
         
         # 如果文件变小了（可能是日志轮转），重置位置
         if current_size < self.last_position:
-            print(f"\033[33m[!] 检测到日志文件 {self.log_file} 可能已轮转，重置读取位置\033[0m")
+            logger.warning(f"检测到日志文件 {self.log_file} 可能已轮转，重置读取位置")
             self.last_position = 0
+            self._partial_line = b''
         
         # 如果文件没有变化，直接返回
         if current_size <= self.last_position:
-            return
+            return 0, 0
             
-        # 读取新增内容
-        with open(self.log_file, 'r', encoding='utf-8', errors='ignore') as f:
+        # 读取新增内容，按实际读到的字节数推进位置
+        with open(self.log_file, 'rb') as f:
             f.seek(self.last_position)
-            new_content = f.read()
-        
-        # 更新文件位置
-        self.last_position = current_size
+            data = f.read()
+        read_size = len(data)
+        self.last_position += read_size
+
+        # 末尾不完整的一行留到下次读取
+        data = self._partial_line + data
+        end = data.rfind(b'\n') + 1
+        self._partial_line = data[end:]
         
         # 处理新增内容
-        self._process_new_content(new_content)
+        self._process_new_content(data[:end].decode('utf-8', errors='ignore'))
+        logger.flush()
+        return read_size, data.count(b'\n', 0, end)
+
+    def get_stats(self):
+        """返回事件数、读取次数、事件/读取比、平均与最大摄入延迟"""
+        reads = self.total_reads
+        return {
+            'events': self.total_events,
+            'reads': reads,
+            'ratio': round(self.total_events / reads, 1) if reads else 0.0,
+            'avg_lag': round(self.total_lag / reads, 3) if reads else 0.0,
+            'max_lag': round(self.max_lag, 3),
+            'interval': round(self.interval, 3),
+        }
     
     def _process_new_content(self, content):
         """处理新增的日志内容"""
@@ -81,14 +163,14 @@ class LogFileHandler(FileSystemEventHandler):
             
         # 提取IP和访问路径
         log_lines = content.strip().split('\n')
-        print(f"\033[36m[*] 检测到 {len(log_lines)} 条新日志记录\033[0m")
+        logger.info(f"检测到 {len(log_lines)} 条新日志记录", log_file=self.log_file)
         
         ip_path_entries = extract_ip_and_path(log_lines)
         if not ip_path_entries:
             return
             
-        # 过滤已存在的IP
-        new_ips = {ip for ip, _ in ip_path_entries if ip not in self.existing_bans}
+        # 过滤已存在的IP：先去重，每个 IP 只在长期驻留的 IPSet 中查找一次
+        new_ips = {ip for ip in {ip for ip, _ in ip_path_entries} if ip not in self.existing_bans}
         if not new_ips:
             return
             
@@ -106,54 +188,114 @@ class LogFileHandler(FileSystemEventHandler):
         banned_count = 0
         skipped_count = 0
         whitelist_count = 0
+        failed_count = 0
         whitelisted_ips = set()
+        processed_ips = set()
         
-        print("\033[36m[*] 处理新的封禁...\033[0m")
+        logger.info("处理新的封禁...")
         
         for ip, path, pattern in matched_entries:
             # 跳过已处理的IP
-            if ip in self.processed_ips:
+            if ip in processed_ips:
                 continue
             
             # 检查是否在白名单中
             if ip in self.whitelist:
                 if ip not in whitelisted_ips:
-                    print(f"\033[33m[!] 跳过白名单中的IP: {ip}\033[0m")
+                    logger.debug(f"跳过白名单中的IP: {ip}", ip=ip)
                     whitelisted_ips.add(ip)
                     whitelist_count += 1
+                    self.events.record(EVENT_WHITELIST, ip, path, pattern, 'watch')
                 continue
                 
             # 检查IP是否已在UFW黑名单中
             if ip in self.ufw_bans:
-                print(f"\033[33m[!] 跳过已存在于UFW黑名单的IP: {ip}\033[0m")
+                logger.debug(f"跳过已存在于UFW黑名单的IP: {ip}", ip=ip)
                 if self.db_client.save_ban(ip, path, pattern):
                     skipped_count += 1
-                    self.processed_ips.add(ip)
+                    processed_ips.add(ip)
                     self.existing_bans.add(ip)
+                    self.events.record(EVENT_SKIP_EXISTING, ip, path, pattern, 'watch')
                 else:
-                    print(f"\033[31m[!] 保存IP到数据库失败: {ip}\033[0m")
+                    logger.error(f"保存IP到数据库失败: {ip}", ip=ip)
                 continue
                 
             # 执行封禁
-            print_ban_info(ip, path, pattern)
+            logger.ban_detail(ip, path, pattern)
             success, error = self.ufw_client.ban_ip(ip)
             if success:
                 if self.db_client.save_ban(ip, path, pattern):
                     banned_count += 1
-                    self.processed_ips.add(ip)
+                    processed_ips.add(ip)
                     self.existing_bans.add(ip)
                     self.ufw_bans.add(ip)
+                    self.events.record(EVENT_BAN, ip, path, pattern, 'watch')
                 else:
-                    print(f"\033[31m[!] 保存IP到数据库失败: {ip}\033[0m")
+                    logger.error(f"保存IP到数据库失败: {ip}", ip=ip)
             else:
-                print(f"\033[31m[!] 封禁IP失败 {ip}: {error}\033[0m")
+                failed_count += 1
+                logger.error(f"封禁IP失败 {ip}: {error}", ip=ip)
+                self.events.record(EVENT_FAILURE, ip, path, pattern, 'watch', error)
         
-        if banned_count > 0 or skipped_count > 0 or whitelist_count > 0:
-            print("\033[36m" + "="*50 + "\033[0m")
-            print(f"\033[1m本次封禁：\033[32m{banned_count}\033[0m 个IP")
-            print(f"\033[1m本次跳过：\033[33m{skipped_count}\033[0m 个IP")
-            print(f"\033[1m白名单跳过：\033[33m{whitelist_count}\033[0m 个IP")
-            print("\033[36m" + "="*50 + "\033[0m")
+        if banned_count > 0 or skipped_count > 0 or whitelist_count > 0 or failed_count > 0:
+            logger.summary('watch', format_ban_summary(banned_count, skipped_count, whitelist_count, failed_count),
+                           log_file=self.log_file, banned=banned_count, skipped=skipped_count,
+                           whitelisted=whitelist_count, failed=failed_count)
+
+
+class ReadScheduler:
+    """按各文件的自适应间隔驱动读取，并定期输出事件/读取统计"""
+
+    def __init__(self, handlers, stats_interval=60.0):
+        self.handlers = handlers
+        self.stats_interval = stats_interval
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._thread.join(timeout=5)
+        if self._thread.is_alive():
+            logger.warning("读取线程未能在预期时间内停止")
+            return
+        self.report_stats()
+
+    def _run(self):
+        now = time.monotonic()
+        next_due = {handler: now + handler.interval for handler in self.handlers}
+        next_report = now + self.stats_interval
+        while not self._stop_event.is_set():
+            now = time.monotonic()
+            for handler in self.handlers:
+                if now < next_due[handler]:
+                    continue
+                self._poll(handler, now)
+                next_due[handler] = time.monotonic() + handler.interval
+            if self.stats_interval > 0 and now >= next_report:
+                self.report_stats()
+                next_report = now + self.stats_interval
+            self._stop_event.wait(max(min(next_due.values()) - time.monotonic(), 0))
+        # 退出前在本线程内处理最后一批尚未读取的内容，避免与 stop() 并发读取
+        for handler in self.handlers:
+            self._poll(handler, time.monotonic())
+
+    @staticmethod
+    def _poll(handler, now):
+        try:
+            handler.poll(now)
+        except Exception as e:
+            logger.error(f"处理日志文件 {handler.log_file} 时发生错误: {str(e)}")
+
+    def report_stats(self):
+        for handler in self.handlers:
+            stats = handler.get_stats()
+            logger.info(f"{handler.log_file}: 事件 {stats['events']} 次，读取 {stats['reads']} 次 "
+                        f"(事件/读取 {stats['ratio']})，摄入延迟 平均 {stats['avg_lag']}s / 最大 {stats['max_lag']}s，"
+                        f"当前间隔 {stats['interval']}s",
+                        log_file=handler.log_file, **stats)
 
 
 class LogWatchdog:
@@ -164,9 +306,12 @@ class LogWatchdog:
         self.config = load_config()
         if self.config is None:
             raise ValueError("无法加载配置文件")
+        logger.load_config(self.config)
         self.db_client = DatabaseClient()
         self.ufw_client = UFWClient(self.db_client)
-        self.observer = Observer()
+        self.events = EventStore()
+        self.observer = None
+        self.scheduler = None
         self.handlers = []
         
     def start(self):
@@ -175,47 +320,78 @@ class LogWatchdog:
         patterns = self.config.get('patterns', [])
         
         if not log_paths:
-            print("\033[31m[!] 错误: 配置文件中未找到日志路径\033[0m")
+            logger.error("配置文件中未找到日志路径")
             return False
             
         if not patterns:
-            print("\033[31m[!] 错误: 配置文件中未找到匹配模式\033[0m")
+            logger.error("配置文件中未找到匹配模式")
             return False
         
-        print("\033[36m[*] 启动日志监控守护进程...\033[0m")
-        print(f"\033[36m[*] 监控日志文件: {', '.join(log_paths)}\033[0m")
+        logger.info("启动日志监控守护进程...")
+        logger.info(f"监控日志文件: {', '.join(log_paths)}")
         
         for log_path in log_paths:
             if not os.path.isfile(log_path):
-                print(f"\033[33m[!] 警告: 日志文件不存在: {log_path}\033[0m")
+                logger.warning(f"日志文件不存在: {log_path}")
                 continue
                 
-            log_dir = os.path.dirname(log_path)
-            handler = LogFileHandler(log_path, patterns, self.db_client, self.ufw_client, self.config)
+            handler = LogFileHandler(log_path, patterns, self.db_client, self.ufw_client, self.config, self.events)
             self.handlers.append(handler)
-            
-            self.observer.schedule(handler, log_dir, recursive=False)
-            print(f"\033[32m[+] 成功添加监控: {log_path}\033[0m")
+            logger.success(f"成功添加监控: {log_path}")
         
         if not self.handlers:
-            print("\033[31m[!] 错误: 没有有效的日志文件可以监控\033[0m")
+            logger.error("没有有效的日志文件可以监控")
             return False
-            
-        self.observer.start()
-        print("\033[32m[+] 监控守护进程已启动\033[0m")
+
+        watch_config = self.config.get('watch') or {}
+        if watch_config.get('polling', False):
+            logger.info("已配置为轮询模式")
+            self._enable_polling()
+        else:
+            self._start_observer()
+
+        self.scheduler = ReadScheduler(self.handlers, float(watch_config.get('stats_interval', 60)))
+        self.scheduler.start()
+        logger.success("监控守护进程已启动")
         return True
+
+    def _start_observer(self):
+        """启动文件事件监听；inotify 不可用时退回到基于 stat 的轮询"""
+        try:
+            self.observer = Observer()
+            for handler in self.handlers:
+                self.observer.schedule(handler, os.path.dirname(handler.log_file), recursive=False)
+            self.observer.start()
+        except OSError as e:
+            logger.warning(f"无法启动文件事件监听 ({str(e)})，改用轮询模式")
+            # 部分 watch 可能已注册或线程已启动，先停止再丢弃
+            if self.observer is not None:
+                try:
+                    self.observer.stop()
+                except Exception:
+                    pass
+            self.observer = None
+            self._enable_polling()
+
+    def _enable_polling(self):
+        for handler in self.handlers:
+            handler.polling = True
         
     def stop(self):
         """停止监控"""
         try:
-            self.observer.stop()
-            self.observer.join(timeout=2)
-            if self.observer.is_alive():
-                print("\033[33m[!] 警告: 监控进程未能在预期时间内停止\033[0m")
+            if self.observer:
+                self.observer.stop()
+                self.observer.join(timeout=2)
+                if self.observer.is_alive():
+                    logger.warning("监控进程未能在预期时间内停止")
+            if self.scheduler:
+                self.scheduler.stop()
         except Exception as e:
-            print(f"\033[31m[!] 停止监控时发生错误: {str(e)}\033[0m")
+            logger.error(f"停止监控时发生错误: {str(e)}")
         finally:
-            print("\033[36m[*] 监控守护进程已停止\033[0m")
+            self.events.close()
+            logger.info("监控守护进程已停止")
 
 
 def main():
@@ -226,25 +402,26 @@ def main():
         if not watchdog.start():
             return 1
             
-        print("\033[36m[*] 按 Ctrl+C 停止监控...\033[0m")
+        logger.info("按 Ctrl+C 停止监控...")
         # 使用事件来控制主循环
         stop_event = threading.Event()
         while not stop_event.is_set():
             try:
                 stop_event.wait(1)
+                logger.flush()
             except KeyboardInterrupt:
                 break
     except KeyboardInterrupt:
-        print("\033[36m[*] 接收到停止信号，正在停止...\033[0m")
+        logger.info("接收到停止信号，正在停止...")
     except Exception as e:
-        print(f"\033[31m[!] 发生错误: {str(e)}\033[0m")
+        logger.error(f"发生错误: {str(e)}")
         return 1
     finally:
         if watchdog:
             try:
                 watchdog.stop()
             except Exception as e:
-                print(f"\033[31m[!] 停止监控时发生错误: {str(e)}\033[0m")
+                logger.error(f"停止监控时发生错误: {str(e)}")
     return 0
 
 
@@ -9,12 +9,15 @@ from collections import defaultdict
 from UFWClient import UFWClient
 from fnmatch import fnmatch
 from DatabaseClient import DatabaseClient
+from Logger import logger
+from IPSet import parse_ip
+from EventStore import EventStore, EVENT_BAN, EVENT_SKIP_EXISTING, EVENT_WHITELIST, EVENT_FAILURE
 
 # 修改导入部分
-from utils import extract_ip_and_path, match_paths, print_ban_info, load_config, tail_logs
+from utils import extract_ip_and_path, match_paths, load_config, tail_logs, format_ban_summary, load_whitelist
 
 def signal_handler(signum, frame):
-    print("\n\033[33m[!] 程序被用户中断，正在退出...\033[0m")
+    logger.warning("程序被用户中断，正在退出...")
     sys.exit(0)
 
 def process_bans():
@@ -25,26 +28,30 @@ def process_bans():
     signal.signal(signal.SIGINT, signal_handler)
     
     config = load_config()
+    logger.load_config(config)
     db_client = DatabaseClient()
     ufw = UFWClient(db_client)
+    events = EventStore()
     
     log_paths: List[str] = config.get('log', [])
     patterns: List[str] = config.get('patterns', [])
-    whitelist: List[str] = config.get('whitelist', [])
+    whitelist: Set[str] = load_whitelist(config)
     log_lines: int = config.get('log_lines', 5000)
 
-    print("\033[36m[*] Reading logs...\033[0m")
+    logger.info("Reading logs...")
     log_data = tail_logs(log_paths, log_lines)
     ip_path_entries = extract_ip_and_path(log_data)
 
-    print("\033[36m[*] Checking existing bans...\033[0m")
-    existing_bans = {ip for ip, _ in db_client.get_existing_bans()}
+    logger.info("Checking existing bans...")
+    # 单次运行的临时集合用 set 即可，查找比 IPSet 快；数据库中的 IP 已是规范形式
+    existing_bans = set(db_client.get_all_banned_ips())
     # 获取UFW现有黑名单
     success, ufw_result = ufw.get_banned_ips()
     if not success:
-        print(f"\033[31m[!] Failed to get UFW bans: {ufw_result}\033[0m")
+        logger.error(f"Failed to get UFW bans: {ufw_result}")
         return
-    ufw_bans = {ip for ip, _ in ufw_result}
+    # 网段规则无法与单个 IP 比较，跳过
+    ufw_bans = {ip for ip, _ in ufw_result if parse_ip(ip) is not None}
 
     new_ips = {ip for ip, _ in ip_path_entries if ip not in existing_bans}
     
@@ -52,13 +59,14 @@ def process_bans():
     matched_entries = match_paths(new_entries, patterns)
 
     if not matched_entries:
-        print("\033[33m[!] No new IPs to ban\033[0m")
+        logger.warning("No new IPs to ban")
         return
 
-    print("\033[36m[*] Processing bans...\033[0m")
+    logger.info("Processing bans...")
     banned_count = 0
     skipped_count = 0
     whitelist_count = 0  # 新增：统计白名单跳过数量
+    failed_count = 0
     processed_ips = set()
     whitelisted_ips = set()
     
@@ -68,36 +76,39 @@ def process_bans():
             
         if ip in whitelist:
             if ip not in whitelisted_ips:
-                print(f"\033[33m[!] Skipping ban for whitelisted IP: {ip}\033[0m")
+                logger.debug(f"Skipping ban for whitelisted IP: {ip}", ip=ip)
                 whitelisted_ips.add(ip)
                 whitelist_count += 1  # 新增：增加白名单计数
+                events.record(EVENT_WHITELIST, ip, path, pattern, 'bp')
             continue
             
         if ip in ufw_bans:
-            print(f"\033[33m[!] Skipping UFW ban for existing IP: {ip}\033[0m")
+            logger.debug(f"Skipping UFW ban for existing IP: {ip}", ip=ip)
             if db_client.save_ban(ip, path, pattern):
                 skipped_count += 1
                 processed_ips.add(ip)
+                events.record(EVENT_SKIP_EXISTING, ip, path, pattern, 'bp')
             else:
-                print(f"\033[31m[!] Failed to save ban to database for IP: {ip}\033[0m")
+                logger.error(f"Failed to save ban to database for IP: {ip}", ip=ip)
             continue
             
-        print_ban_info(ip, path, pattern)
+        logger.ban_detail(ip, path, pattern)
         success, error = ufw.ban_ip(ip)
         if success:
             if db_client.save_ban(ip, path, pattern):
                 banned_count += 1
                 processed_ips.add(ip)
+                events.record(EVENT_BAN, ip, path, pattern, 'bp')
             else:
-                print(f"\033[31m[!] Failed to save ban to database for IP: {ip}\033[0m")
+                logger.error(f"Failed to save ban to database for IP: {ip}", ip=ip)
         else:
-            print(f"\033[31m[!] Failed to ban IP {ip}: {error}\033[0m")
+            failed_count += 1
+            logger.error(f"Failed to ban IP {ip}: {error}", ip=ip)
+            events.record(EVENT_FAILURE, ip, path, pattern, 'bp', error)
 
-    print("\033[36m" + "="*50 + "\033[0m")
-    print(f"\033[1m本次封禁：\033[32m{banned_count}\033[0m 个IP")
-    print(f"\033[1m本次跳过：\033[33m{skipped_count}\033[0m 个IP")
-    print(f"\033[1m白名单跳过：\033[33m{whitelist_count}\033[0m 个IP")  # 新增：显示白名单跳过数量
-    print("\033[36m" + "="*50 + "\033[0m")
+    logger.summary('bp', format_ban_summary(banned_count, skipped_count, whitelist_count, failed_count),
+                   banned=banned_count, skipped=skipped_count, whitelisted=whitelist_count, failed=failed_count)
+    events.close()
 
 if __name__ == '__main__':
     from CLIHandler import CLIHandler
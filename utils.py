@@ -4,6 +4,9 @@ import os
 import sys
 from fnmatch import fnmatch
 import subprocess
+import time
+from Logger import logger
+from IPSet import normalize_ip, parse_ip
 
 def load_config():
     try:
@@ -34,11 +37,56 @@ def tail_logs(log_paths, lines=5000):
             log_data.extend(output.stdout.strip().split("\n"))
     return log_data
 
+_IPV4_RE = r'\d{1,3}(?:\.\d{1,3}){3}'
+_IPV6_RE = r'[0-9A-Fa-f]{0,4}(?::[0-9A-Fa-f]{0,4}){2,7}(?:' + _IPV4_RE + r')?'
+# IPv4 只要求两侧不是数字或点，允许 1.2.3.4:port、ip:1.2.3.4 这类写法
+_IP_CANDIDATE = re.compile(r'((?<![0-9A-Fa-f:.])' + _IPV6_RE + r'(?![0-9A-Fa-f:.])'
+                           r'|(?<![0-9.])' + _IPV4_RE + r'(?![0-9.]))')
+_REQUEST_PATTERN = re.compile(r'"(GET|POST|HEAD|PUT|DELETE)\s([^\s]+)')
+
 def extract_ip_and_path(log_data):
-    pattern = re.compile(r'(\d+\.\d+\.\d+\.\d+).+?"(GET|POST|HEAD|PUT|DELETE)\s([^\s]+)')
-    extracted = [(m.group(1), m.group(3)) for m in pattern.finditer('\n'.join(log_data))]
+    """提取日志中的 (IP, 路径)，支持 IPv4 与 IPv6，IP 统一为规范形式
+
+    时间戳等形似 IPv6 的片段会被跳过，继续尝试同一行中后面的候选：
+
+    >>> extract_ip_and_path(['[19/Oct/2026:11:57:14 +0000] 8.8.8.8 "GET /d HTTP/1.1"'])
+    [('8.8.8.8', '/d')]
+    >>> extract_ip_and_path(['2026/10/19 11:57:14 client: 7.7.7.7 "GET /e HTTP/1.1"'])
+    [('7.7.7.7', '/e')]
+    >>> extract_ip_and_path(['2001:DB8::1 - - [19/Oct/2026:11:57:14 +0000] "POST /f HTTP/1.1"'])
+    [('2001:db8::1', '/f')]
+
+    IPv4 后带端口或前面带 key: 前缀时同样可以提取：
+
+    >>> extract_ip_and_path(['1.2.3.4:52100 - - [x] "GET /a HTTP/1.1"'])
+    [('1.2.3.4', '/a')]
+    >>> extract_ip_and_path(['[client 1.2.3.4:52100] "GET /d HTTP/1.1"'])
+    [('1.2.3.4', '/d')]
+    >>> extract_ip_and_path(['ip:1.2.3.4 "GET /c HTTP/1.1"'])
+    [('1.2.3.4', '/c')]
+    """
+    extracted = []
+    for line in log_data:
+        for m in _IP_CANDIDATE.finditer(line):
+            ip = normalize_ip(m.group(1))
+            if ip is None:
+                continue
+            request = _REQUEST_PATTERN.search(line, m.end() + 1)
+            if request:
+                extracted.append((ip, request.group(2)))
+                break
     return extracted
 
+def load_whitelist(config):
+    """读取配置中的白名单为规范化 IP 字符串的集合，忽略并提示无效条目"""
+    valid = []
+    for entry in (config or {}).get('whitelist', []) or []:
+        if parse_ip(str(entry)) is None:
+            logger.warning(f"忽略无效的白名单条目: {entry}")
+            continue
+        valid.append(normalize_ip(str(entry)))
+    return set(valid)
+
 def match_paths(entries, patterns):
     matched = set()
     for ip, path in entries:
@@ -54,12 +102,35 @@ def match_paths(entries, patterns):
                 matched.add((ip, path, pattern))
     return matched
 
-def print_ban_info(ip: str, path: str, pattern: str) -> None:
-    print("\033[32m+" + "="*50 + "+\033[0m")
-    print(f"\033[32m| IP地址: {ip:<42} |\033[0m")
-    print(f"\033[36m| 访问路径: {path:<40} |\033[0m")
-    print(f"\033[33m| 匹配规则: {pattern:<40} |\033[0m")
-    print("\033[32m+" + "="*50 + "+\033[0m")
+def format_ban_summary(banned_count, skipped_count, whitelist_count, failed_count=0):
+    """生成一批封禁处理的汇总文本"""
+    lines = [
+        "\033[36m" + "="*50 + "\033[0m",
+        f"\033[1m本次封禁：\033[32m{banned_count}\033[0m 个IP",
+        f"\033[1m本次跳过：\033[33m{skipped_count}\033[0m 个IP",
+        f"\033[1m白名单跳过：\033[33m{whitelist_count}\033[0m 个IP",
+    ]
+    if failed_count:
+        lines.append(f"\033[1m封禁失败：\033[31m{failed_count}\033[0m 个IP")
+    lines.append("\033[36m" + "="*50 + "\033[0m")
+    return lines
+
+def make_progress(label: str, total: int, interval: float = 0.5):
+    """返回一个进度回调，按时间间隔刷新单行进度（速率与预计剩余时间）"""
+    started = time.monotonic()
+    last_report = [0.0]
+
+    def report(done: int) -> None:
+        now = time.monotonic()
+        if done < total and now - last_report[0] < interval:
+            return
+        last_report[0] = now
+        elapsed = max(now - started, 1e-6)
+        rate = done / elapsed
+        eta = (total - done) / rate if rate > 0 else 0
+        logger.progress(label, done, total, rate, eta)
+
+    return report
 
 def get_application_path():
     """获取应用程序路径，处理 PyInstaller 打包和开发环境的情况"""